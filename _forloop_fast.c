@@ -0,0 +1,97 @@
+/*
+ * Optional C implementation of forloop.is_append.
+ *
+ * forloop.py uses this module when it can be imported and falls back to the
+ * pure Python predicate otherwise. Build it in place with, for example:
+ *
+ *     cc -shared -fPIC -O2 $(python3-config --includes) \
+ *         _forloop_fast.c -o _forloop_fast$(python3-config --extension-suffix)
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+/* ast node classes and attribute names, fetched once at module init */
+static PyObject *ExprType;
+static PyObject *CallType;
+static PyObject *AttributeType;
+static PyObject *value_str;
+static PyObject *func_str;
+static PyObject *attr_str;
+static PyObject *append_str;
+
+static PyObject *
+is_append(PyObject *module, PyObject *node)
+{
+    PyObject *value, *func, *attr;
+    int result = 0;
+
+    if ((PyObject *)Py_TYPE(node) != ExprType) {
+        Py_RETURN_FALSE;
+    }
+    value = PyObject_GetAttr(node, value_str);
+    if (value == NULL) {
+        return NULL;
+    }
+    if ((PyObject *)Py_TYPE(value) == CallType) {
+        func = PyObject_GetAttr(value, func_str);
+        if (func == NULL) {
+            Py_DECREF(value);
+            return NULL;
+        }
+        if ((PyObject *)Py_TYPE(func) == AttributeType) {
+            attr = PyObject_GetAttr(func, attr_str);
+            if (attr == NULL) {
+                Py_DECREF(func);
+                Py_DECREF(value);
+                return NULL;
+            }
+            /* Parsed identifiers are interned, so the pointer test usually decides it */
+            result = attr == append_str ||
+                (PyUnicode_Check(attr) && PyUnicode_Compare(attr, append_str) == 0);
+            Py_DECREF(attr);
+        }
+        Py_DECREF(func);
+    }
+    Py_DECREF(value);
+    return PyBool_FromLong(result);
+}
+
+static PyMethodDef forloop_fast_methods[] = {
+    {"is_append", is_append, METH_O,
+     "Checks if the given AST node represents an append operation."},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef forloop_fast_module = {
+    PyModuleDef_HEAD_INIT,
+    "_forloop_fast",
+    "C implementation of the forloop append predicate.",
+    -1,
+    forloop_fast_methods
+};
+
+PyMODINIT_FUNC
+PyInit__forloop_fast(void)
+{
+    PyObject *ast = PyImport_ImportModule("ast");
+    if (ast == NULL) {
+        return NULL;
+    }
+    ExprType = PyObject_GetAttrString(ast, "Expr");
+    CallType = PyObject_GetAttrString(ast, "Call");
+    AttributeType = PyObject_GetAttrString(ast, "Attribute");
+    Py_DECREF(ast);
+    if (ExprType == NULL || CallType == NULL || AttributeType == NULL) {
+        return NULL;
+    }
+
+    value_str = PyUnicode_InternFromString("value");
+    func_str = PyUnicode_InternFromString("func");
+    attr_str = PyUnicode_InternFromString("attr");
+    append_str = PyUnicode_InternFromString("append");
+    if (value_str == NULL || func_str == NULL || attr_str == NULL || append_str == NULL) {
+        return NULL;
+    }
+
+    return PyModule_Create(&forloop_fast_module);
+}
@@ -1,26 +1,116 @@
+# cython: language_level=3, infer_types=True
+#
+# This module can be compiled unmodified with Cython. Build it in place with:
+#
+#     cythonize -i forloop.py
+#
+# The compiled extension is imported ahead of forloop.py when both are
+# present; deleting it falls back to the pure Python module.
 import ast
-from typing import Optional, List, Set
+import contextlib
+import functools
+import io
+from typing import Any, Callable, Dict, FrozenSet, Iterator, NamedTuple, Optional, List, Set, Tuple
 
 
+# AST node classes used in the hot predicates. These are concrete leaf
+# classes, so ``type(node) is _Expr`` is an exact (and cheaper) test.
+_Expr = ast.Expr
+_Call = ast.Call
+_Attribute = ast.Attribute
+_Name = ast.Name
+_Assign = ast.Assign
+_Subscript = ast.Subscript
+_For = ast.For
 
-def find_lists_that_append(forloop: ast.For) -> Set[str]:
+# Load contexts carry no state, so one instance is shared by all nodes we build
+_LOAD = ast.Load()
+
+# The per-node caches of the helpers decorated with _by_id, so that
+# clear_caches() can drop all of them at once.
+_node_caches: List[Dict[int, Tuple[ast.AST, Any]]] = []
+
+# How many cached_pass() blocks are open; results are only cached inside one
+_cache_depth = 0
+
+
+def _by_id(fn: Callable[[ast.AST], Any]) -> Callable[[ast.AST], Any]:
     """
-    Finds lists that are being appended to in a for loop.
+    Caches the result of a single-node helper, keyed by id(node).
+
+    Results are only cached while a cached_pass() block is open, and are
+    dropped when the outermost block exits. The node is stored alongside its
+    result so its id cannot be reused while the entry is alive.
 
     Args:
-        forloop (ast.For): The Node to analyze.
+        fn (Callable[[ast.AST], Any]): The helper to cache.
 
     Returns:
-        Set[str]: A set containing the names of the lists being appended to.
+        Callable[[ast.AST], Any]: The cached helper.
+    """
+    cache: Dict[int, Tuple[ast.AST, Any]] = {}
+    _node_caches.append(cache)
+
+    @functools.wraps(fn)
+    def wrapper(node: ast.AST) -> Any:
+        if not _cache_depth:
+            return fn(node)
+        key = id(node)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache[key] = (node, fn(node))
+        return entry[1]
+    return wrapper
+
+def _name(id: str) -> ast.Name:
+    """
+    Creates a loaded name expression.
+
+    A fresh node is returned on each call, since callers may modify the
+    comprehensions they get back; only the stateless Load context is shared.
+
+    Args:
+        id (str): The variable name.
+
+    Returns:
+        ast.Name: The name expression AST node.
+    """
+    return ast.Name(id=id, ctx=_LOAD)
+
+def clear_caches() -> None:
+    """
+    Clears the cached append-detection results.
+
+    cached_pass() calls this when its outermost block exits, so callers only
+    need it to drop results early inside a long-running block.
     """
-    appended_lists: Set[str] = set()
-    for subnode in forloop.body:
-        if isinstance(subnode, ast.Expr) and isinstance(subnode.value, ast.Call):
-            call = subnode.value
-            if isinstance(call.func, ast.Attribute) and call.func.attr == 'append':
-                if isinstance(call.func.value, ast.Name):
-                    appended_lists.add(call.func.value.id)
-    return appended_lists
+    for cache in _node_caches:
+        cache.clear()
+
+@contextlib.contextmanager
+def cached_pass() -> Iterator[None]:
+    """
+    Caches the append-detection results for the duration of the block.
+
+    Outside a block, analyze_for and the helpers that read from it
+    (find_lists_that_append, ifs_with_appends, for_has_append,
+    find_appends_at_base, is_candidate_for_comprehension) analyze the loop
+    afresh on every call; wrap repeated calls on an unchanged tree in one
+    block to reuse the analysis. for_loop_to_list_comprehension opens its
+    own block.
+
+    Blocks may be nested; the caches are cleared when the outermost block
+    exits. The AST must not be mutated inside the block.
+    """
+    global _cache_depth
+    _cache_depth += 1
+    try:
+        yield
+    finally:
+        _cache_depth -= 1
+        if not _cache_depth:
+            clear_caches()
+
 
 def is_append(node: ast.AST) -> bool:
     """
@@ -32,13 +122,109 @@ def is_append(node: ast.AST) -> bool:
     Returns:
         bool: True if the node represents an append operation, False otherwise.
     """
-    if isinstance(node, ast.Expr) and \
-        isinstance(node.value, ast.Call) and \
-        isinstance(node.value.func, ast.Attribute) and \
-        node.value.func.attr == 'append':
-        return True
+    if node.__class__ is _Expr:
+        value = node.value
+        if value.__class__ is _Call:
+            func = value.func
+            return func.__class__ is _Attribute and func.attr == 'append'
     return False
 
+try:
+    # Optional C implementation, see _forloop_fast.c
+    from _forloop_fast import is_append
+except ImportError:
+    pass
+
+def _contains_append(node: ast.AST) -> bool:
+    """
+    Checks if the given statement, or any statement nested in its blocks,
+    represents an append operation.
+
+    Only statement blocks (body, orelse, finalbody, handlers and match
+    cases) are searched; an append is always a statement-level ast.Expr,
+    so expression subtrees are never entered.
+
+    Args:
+        node (ast.AST): The AST node to search.
+
+    Returns:
+        bool: True if an append operation was found, False otherwise.
+    """
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if is_append(current):
+            return True
+        for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases'):
+            block = getattr(current, field, None)
+            if block:
+                stack.extend(block)
+    return False
+
+def _find_appends(node: ast.AST) -> List[ast.Expr]:
+    """
+    Finds the append operations in the given statement and the statements
+    nested in its blocks, searched the same way as _contains_append.
+
+    Args:
+        node (ast.AST): The AST node to search.
+
+    Returns:
+        List[ast.Expr]: The append operation AST nodes.
+    """
+    appends = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if is_append(current):
+            appends.append(current)
+            continue
+        for field in ('body', 'orelse', 'finalbody', 'handlers', 'cases'):
+            block = getattr(current, field, None)
+            if block:
+                stack.extend(block)
+    return appends
+
+def _find_if_appends(node: ast.If) -> List[ast.Expr]:
+    """
+    Finds the append operations in the blocks of an if statement, descending
+    only into nested if statements.
+
+    Args:
+        node (ast.If): The if statement AST node to search.
+
+    Returns:
+        List[ast.Expr]: The append operation AST nodes.
+    """
+    appends = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if is_append(current):
+            appends.append(current)
+        elif type(current) is ast.If:
+            stack.extend(current.body)
+            stack.extend(current.orelse)
+    return appends
+
+def _collect_names(node: ast.AST, names: Set[str]) -> None:
+    """
+    Adds the variable names used in the given AST node to a set.
+
+    Args:
+        node (ast.AST): The AST node to search.
+        names (Set[str]): The set to add the names to.
+    """
+    add_name = names.add
+    iter_child_nodes = ast.iter_child_nodes
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if type(current) is _Name:
+            add_name(current.id)
+            continue
+        stack.extend(iter_child_nodes(current))
+
 def if_has_append(node: ast.If) -> bool:
     """
     Checks if the given if statement contains an append operation.
@@ -49,10 +235,100 @@ def if_has_append(node: ast.If) -> bool:
     Returns:
         bool: True if the if statement contains an append operation, False otherwise.
     """
-    for supernode in ast.walk(node):
-        if is_append(supernode):
-            return True
-    return False
+    return _contains_append(node)
+
+class ForAnalysis(NamedTuple):
+    """
+    The append-related facts about a for loop, gathered in one pass over its body.
+
+    Attributes:
+        appended_names (FrozenSet[str]): The names of the lists appended to directly in the loop body.
+        base_appends (Tuple[ast.Expr, ...]): The append operations directly within the loop body.
+        if_appends (Tuple[ast.If, ...]): The if statements in the loop body with append operations.
+        element_lists (FrozenSet[str]): The lists, as source text, appended to directly in the
+                                        loop body or in its if statements.
+        element_names (FrozenSet[str]): The variable names used in the arguments of those
+                                        append operations.
+        has_append (bool): True if the loop contains an append operation at any depth.
+        has_ifs (bool): True if the loop body contains an if statement.
+    """
+    appended_names: FrozenSet[str]
+    base_appends: Tuple[ast.Expr, ...]
+    if_appends: Tuple[ast.If, ...]
+    element_lists: FrozenSet[str]
+    element_names: FrozenSet[str]
+    has_append: bool
+    has_ifs: bool
+
+@_by_id
+def analyze_for(node: ast.For) -> ForAnalysis:
+    """
+    Analyzes the body of a for loop in a single pass.
+
+    Inside a cached_pass() block the result is computed once per node.
+
+    Args:
+        node (ast.For): The for loop AST node to analyze.
+
+    Returns:
+        ForAnalysis: The facts gathered about the loop.
+    """
+    appended_names: Set[str] = set()
+    base_appends: List[ast.Expr] = []
+    if_appends: List[ast.If] = []
+    element_names: Set[str] = set()
+    appends: List[ast.Expr] = []
+    # The appends that produce the comprehension's elements; appends inside
+    # nested loops, with blocks and so on do not
+    element_appends: List[ast.Expr] = []
+    has_ifs = False
+    for subnode in node.body:
+        if is_append(subnode):
+            base_appends.append(subnode)
+            appends.append(subnode)
+            element_appends.append(subnode)
+            owner = subnode.value.func.value
+            if type(owner) is _Name:
+                appended_names.add(owner.id)
+            continue
+        nested_appends = _find_appends(subnode)
+        appends.extend(nested_appends)
+        if type(subnode) is ast.If:
+            has_ifs = True
+            if nested_appends:
+                if_appends.append(subnode)
+                element_appends.extend(_find_if_appends(subnode))
+
+    element_lists: Set[str] = set()
+    for append in element_appends:
+        owner = append.value.func.value
+        element_lists.add(owner.id if type(owner) is _Name else ast.unparse(owner))
+        for argument in append.value.args:
+            _collect_names(argument, element_names)
+
+    has_append = bool(appends) or \
+        any(_contains_append(subnode) for subnode in node.orelse)
+    return ForAnalysis(
+        appended_names=frozenset(appended_names),
+        base_appends=tuple(base_appends),
+        if_appends=tuple(if_appends),
+        element_lists=frozenset(element_lists),
+        element_names=frozenset(element_names),
+        has_append=has_append,
+        has_ifs=has_ifs,
+    )
+
+def find_lists_that_append(forloop: ast.For) -> Set[str]:
+    """
+    Finds lists that are being appended to in a for loop.
+
+    Args:
+        forloop (ast.For): The Node to analyze.
+
+    Returns:
+        Set[str]: A set containing the names of the lists being appended to.
+    """
+    return set(analyze_for(forloop).appended_names)
 
 def ifs_with_appends(node: ast.For) -> List[ast.If]:
     """
@@ -64,11 +340,7 @@ def ifs_with_appends(node: ast.For) -> List[ast.If]:
     Returns:
         List[ast.If]: A list of if statement AST nodes with append operations.
     """
-    ifs = []
-    for supernode in node.body:
-        if isinstance(supernode, ast.If) and if_has_append(supernode):
-            ifs.append(supernode)
-    return ifs
+    return list(analyze_for(node).if_appends)
 
 def for_has_append(node: ast.For) -> bool:
     """
@@ -80,10 +352,7 @@ def for_has_append(node: ast.For) -> bool:
     Returns:
         bool: True if the for loop contains an append operation, False otherwise.
     """
-    for supernode in ast.walk(node):
-        if is_append(supernode):
-            return True
-    return False
+    return analyze_for(node).has_append
 
 def find_appends_at_base(node: ast.For) -> List[ast.Expr]:
     """
@@ -95,23 +364,61 @@ def find_appends_at_base(node: ast.For) -> List[ast.Expr]:
     Returns:
         List[ast.Expr]: A list of append operation AST nodes.
     """
-    appends = []
-    for subnode in node.body:
-        if is_append(subnode):
-            appends.append(subnode)
-    return appends
+    return list(analyze_for(node).base_appends)
+
+def split_source_lines(source: str) -> List[str]:
+    """
+    Splits source code into lines numbered the way the parser numbers them.
+
+    Split a file once and pass the lines to the converters, rather than
+    handing them the whole source for every loop.
+
+    Args:
+        source (str): The source code.
+
+    Returns:
+        List[str]: The lines of the source code.
+    """
+    return io.StringIO(source, newline=None).readlines()
 
-def is_candidate_for_comprehension(node: ast.For) -> bool:
+def _mentions_append(node: ast.For, lines: List[str]) -> bool:
+    """
+    Checks if the source lines of the given for loop mention 'append'.
+
+    Args:
+        node (ast.For): The for loop AST node to check.
+        lines (List[str]): The lines of the source code the node was parsed from.
+
+    Returns:
+        bool: False if the loop's lines never mention 'append', True otherwise
+              (including when the node has no line numbers).
+    """
+    lineno = getattr(node, 'lineno', None)
+    end_lineno = getattr(node, 'end_lineno', None)
+    if lineno is None or end_lineno is None:
+        return True
+    return 'append' in ''.join(lines[lineno - 1:end_lineno])
+
+def is_candidate_for_comprehension(node: ast.For, lines: Optional[List[str]] = None) -> bool:
     """
     Checks if the given for loop is a candidate for conversion to a list comprehension.
 
     Args:
         node (ast.For): The for loop AST node to check.
+        lines (Optional[List[str]]): The source lines the node was parsed from, as returned
+                                     by split_source_lines(). When given, loops whose lines
+                                     never mention 'append' are rejected without analyzing
+                                     their body.
 
     Returns:
         bool: True if the for loop is a candidate for conversion, False otherwise.
     """
-    return isinstance(node, ast.For) and for_has_append(node)
+    if type(node) is not _For:
+        return False
+    if lines is not None and not _mentions_append(node, lines):
+        return False
+    return analyze_for(node).has_append
+
 def create_element_expr(node: ast.For) -> ast.AST:
     """
     Creates the element expression for the list comprehension.
@@ -122,29 +429,81 @@ def create_element_expr(node: ast.For) -> ast.AST:
     Returns:
         ast.AST: The element expression AST node.
     """
-    # Collect used variable names in the loop body
-    used_variables = set()
-    for subnode in node.body:
-        for name in ast.walk(subnode):
-            if isinstance(name, ast.Name):
-                used_variables.add(name.id)
-
-    if isinstance(node.target, ast.Tuple):
-        # If the target of the for loop is a tuple and both 'name' and 'age' are used,
-        # return the tuple (name, age); otherwise, return just the variable being appended
-        if 'name' in used_variables and 'age' in used_variables:
-            return node.target
-        else:
-            for element in node.target.elts:
-                if isinstance(element, ast.Name):
-                    return ast.Name(id=element.id, ctx=ast.Load())
+    target = node.target
+    if type(target) is ast.Tuple:
+        target_names = [element.id for element in target.elts if type(element) is _Name]
+    elif type(target) is _Name:
+        target_names = [target.id]
     else:
-        # If the target is not a tuple, and the target name is used in the loop body, return the target name
-        if node.target.id in used_variables:
-            return ast.Name(id=node.target.id, ctx=ast.Load())
+        return None
+
+    # Only the names passed to append decide the element, not names used
+    # elsewhere in the body (e.g. only in a condition)
+    used_variables = analyze_for(node).element_names
+
+    if type(target) is ast.Tuple:
+        # If every name in a tuple of several names is appended, return the
+        # whole tuple; otherwise, return just the first of its names appended
+        if len(target.elts) > 1 and len(target_names) == len(target.elts) and \
+            used_variables.issuperset(target_names):
+            return target
+        for name in target_names:
+            if name in used_variables:
+                return _name(name)
+    else:
+        # If the target is not a tuple, and the target name is appended, return the target name
+        if target.id in used_variables:
+            return _name(target.id)
 
     return None  # Return None if it cannot determine the element expression
 
+def _result_key(node: ast.Assign) -> Optional[str]:
+    """
+    Finds the string key of an assignment of the form ``result['key'] = ...``.
+
+    Args:
+        node (ast.Assign): The assignment AST node to check.
+
+    Returns:
+        Optional[str]: The key being assigned, or None if the assignment has another form.
+    """
+    if len(node.targets) == 1 and type(node.targets[0]) is _Subscript:
+        target = node.targets[0]
+        if type(target.value) is _Name and target.value.id == 'result':
+            key = target.slice
+            if type(key) is ast.Constant and type(key.value) is str:
+                return key.value
+    return None
+
+def _check_dict_assign(node: ast.Assign, state: Dict[str, bool]) -> None:
+    """
+    Flags the loop as a dict comprehension if the statement assigns a key of 'result'.
+    """
+    if _result_key(node) is not None:
+        state['dict'] = True
+
+def _check_list_append(node: ast.Expr, state: Dict[str, bool]) -> None:
+    """
+    Flags the loop as a list comprehension if the statement appends to 'result'.
+    """
+    call = node.value
+    if type(call) is _Call:
+        func = call.func
+        if type(func) is _Attribute and func.attr == 'append':
+            if type(func.value) is _Name and func.value.id == 'result':
+                state['list'] = True
+
+def _ignore_statement(node: ast.stmt, state: Dict[str, bool]) -> None:
+    """
+    Handles loop body statements that cannot decide the comprehension type.
+    """
+
+# Handlers for the loop body statements, keyed by statement type
+_COMPREHENSION_TYPE_HANDLERS: Dict[type, Callable[[ast.stmt, Dict[str, bool]], None]] = {
+    _Assign: _check_dict_assign,
+    _Expr: _check_list_append,
+}
+
 def for_loop_to_dict_comprehension(node: ast.For) -> Optional[ast.DictComp]:
     """
     Converts a for loop AST node into a dict comprehension.
@@ -155,51 +514,147 @@ def for_loop_to_dict_comprehension(node: ast.For) -> Optional[ast.DictComp]:
     Returns:
         Optional[ast.DictComp]: The dict comprehension AST node, or None if conversion is not possible.
     """
-    if not isinstance(node, ast.For):
+    if type(node) is not _For:
         return None
 
     # Check if the loop body contains assignments to dictionary keys
     key_assignments = {}
     for subnode in node.body:
-        if isinstance(subnode, ast.Assign) and len(subnode.targets) == 1 and isinstance(subnode.targets[0], ast.Subscript):
-            target = subnode.targets[0]
-            if isinstance(target.value, ast.Name) and target.value.id == 'result' and isinstance(target.slice, ast.Index) and isinstance(target.slice.value, ast.Str):
-                key = target.slice.value.s
-                if isinstance(subnode.value, ast.Name):
-                    value = subnode.value.id
-                    key_assignments[key] = value
-
-    # If there are key assignments, construct the dict comprehension
-    if key_assignments:
+        if type(subnode) is _Assign and type(subnode.value) is _Name:
+            key = _result_key(subnode)
+            if key is not None:
+                key_assignments[key] = subnode.value.id
+
+    # A single key assignment maps onto a dict comprehension; several keys
+    # assigned per iteration have no single key/value comprehension form
+    if len(key_assignments) == 1:
         generators = [ast.comprehension(target=node.target, iter=node.iter, ifs=[], is_async=False)]
-        key_expr = ast.DictCompKey()
-        value_expr = ast.DictCompValue()
-        if_expr = None
-
-        for key, value in key_assignments.items():
-            key_expr.keys.append(ast.Constant(value=key))
-            value_expr.values.append(ast.Name(id=value, ctx=ast.Load()))
+        key, value = next(iter(key_assignments.items()))
 
         # Construct the dict comprehension node
-        dict_comp = ast.DictComp(key=key_expr, value=value_expr, generators=generators, is_async=False)
+        dict_comp = ast.DictComp(
+            key=ast.Constant(value=key),
+            value=_name(value),
+            generators=generators,
+        )
         return dict_comp
 
     return None  # Return None if conversion is not possible
  
-def for_loop_to_list_comprehension(node: ast.For) -> Optional[ast.ListComp]:
+def _is_unique_append(node: ast.For, stmt: ast.If) -> bool:
+    """
+    Checks if the if statement appends the loop target to a list only when
+    it is not already in that list, e.g. ``if x not in seen: seen.append(x)``.
+
+    Args:
+        node (ast.For): The for loop AST node.
+        stmt (ast.If): The if statement AST node from the loop body.
+
+    Returns:
+        bool: True if the if statement deduplicates the loop target, False otherwise.
+    """
+    target = node.target
+    test = stmt.test
+    if type(target) is not _Name or type(test) is not ast.Compare:
+        return False
+    if len(test.ops) != 1 or type(test.ops[0]) is not ast.NotIn:
+        return False
+    left = test.left
+    seen = test.comparators[0]
+    if type(left) is not _Name or left.id != target.id or type(seen) is not _Name:
+        return False
+    if len(stmt.body) != 1 or stmt.orelse or not is_append(stmt.body[0]):
+        return False
+    call = stmt.body[0].value
+    owner = call.func.value
+    if type(owner) is not _Name or owner.id != seen.id:
+        return False
+    return len(call.args) == 1 and not call.keywords and \
+        type(call.args[0]) is _Name and call.args[0].id == target.id
+
+def create_unique_list_expr(node: ast.For) -> ast.Call:
+    """
+    Creates the expression ``list(dict.fromkeys(iter))`` for a deduplicating loop.
+
+    A list comprehension cannot check membership against the list it is
+    building, and the loop itself does so in O(n) per item; dict.fromkeys
+    keeps the first occurrence of each item in order in O(n) overall.
+
+    The rewrite is only equivalent when the items are hashable: the loop
+    compares with ``==`` and accepts any item, whereas dict.fromkeys raises
+    TypeError on unhashable items such as lists. The items' types are not
+    known statically, so callers must check this themselves.
+
+    Args:
+        node (ast.For): The for loop AST node.
+
+    Returns:
+        ast.Call: The expression AST node.
+    """
+    fromkeys = ast.Attribute(value=_name('dict'), attr='fromkeys', ctx=_LOAD)
+    unique = ast.Call(func=fromkeys, args=[node.iter], keywords=[])
+    return ast.Call(func=_name('list'), args=[unique], keywords=[])
+
+def for_loop_to_list_comprehension(node: ast.For, lines: Optional[List[str]] = None) -> Optional[ast.expr]:
     """
     Converts a for loop AST node into a list comprehension.
 
+    Loops that only append items not already in the list are converted to
+    ``list(dict.fromkeys(iter))`` instead, which assumes the items are hashable
+    (see create_unique_list_expr).
+
+    Each call analyzes the loop inside its own cached_pass() block, so the
+    tree may be changed between calls.
+
     Args:
         node (ast.For): The for loop AST node.
+        lines (Optional[List[str]]): The source lines the node was parsed from, as returned
+                                     by split_source_lines(), used to skip loops that never
+                                     mention 'append'.
 
     Returns:
-        Optional[ast.ListComp]: The list comprehension AST node, or None if conversion is not possible.
+        Optional[ast.expr]: The list comprehension (or deduplicating call) AST node, or None if conversion is not possible.
     """
-    if not is_candidate_for_comprehension(node):
+    with cached_pass():
+        if not is_candidate_for_comprehension(node, lines):
+            return None
+        analysis = analyze_for(node)
+        # A single comprehension can only build one list
+        if len(analysis.element_lists) != 1:
+            return None
+        if not analysis.has_ifs:
+            return _convert_simple(node)
+        return _convert_with_ifs(node)
+
+def _convert_simple(node: ast.For) -> Optional[ast.ListComp]:
+    """
+    Converts a candidate for loop without if statements into a list comprehension.
+
+    Args:
+        node (ast.For): The for loop AST node.
+
+    Returns:
+        Optional[ast.ListComp]: The list comprehension AST node, or None if the element cannot be determined.
+    """
+    elt_expr = create_element_expr(node)
+    if elt_expr is None:
         return None
-    
-    
+    return ast.ListComp(
+        elt=elt_expr,
+        generators=[ast.comprehension(target=node.target, iter=node.iter, ifs=[], is_async=False)],
+    )
+
+def _convert_with_ifs(node: ast.For) -> Optional[ast.expr]:
+    """
+    Converts a candidate for loop with if statements into a list comprehension.
+
+    Args:
+        node (ast.For): The for loop AST node.
+
+    Returns:
+        Optional[ast.expr]: The list comprehension (or deduplicating call) AST node,
+                            or None if the element cannot be determined.
+    """
     def create_generators(node: ast.For) -> list[ast.comprehension]:
         return [ast.comprehension(target=node.target, iter=node.iter, ifs=[], is_async=False)]
 
@@ -210,24 +665,29 @@ def for_loop_to_list_comprehension(node: ast.For) -> Optional[ast.ListComp]:
     generators = create_generators(node)
 
     # Construct the 'generators' (loops and conditions) for the list comprehension
-    conditions = []
+    conditions = [stmt.test for stmt in analyze_for(node).if_appends]
+
+    if len(conditions) == 1 and len(loop_body) == 1 and _is_unique_append(node, loop_body[0]):
+        return create_unique_list_expr(node)
 
-    for stmt in loop_body:
-        if isinstance(stmt, ast.If) and if_has_append(stmt):
-            conditions.append(stmt.test)
+    if elt_expr is None:
+        return None
 
-    if conditions:
-        # If there are conditions, combine them with 'and'
+    combined_condition = None
+    if len(conditions) == 1:
         combined_condition = conditions[0]
-        for condition in conditions[1:]:
-            combined_condition = ast.BoolOp(op=ast.And(), values=[combined_condition, condition])
+    elif conditions:
+        # If there are several conditions, combine them with a single 'and'
+        combined_condition = ast.BoolOp(op=ast.And(), values=conditions)
+    if combined_condition is not None:
         generators[-1].ifs.append(combined_condition)
 
     # Handle else statement if present
     else_condition = None
-    for stmt in loop_body:
-        if isinstance(stmt, ast.If) and len(stmt.orelse) != 0:
-            else_condition = ast.UnaryOp(op=ast.Not(), operand=combined_condition)
+    if combined_condition is not None:
+        for stmt in loop_body:
+            if isinstance(stmt, ast.If) and len(stmt.orelse) != 0:
+                else_condition = ast.UnaryOp(op=ast.Not(), operand=combined_condition)
 
     if else_condition:
         # Construct else condition
@@ -248,31 +708,75 @@ def determine_comprehension_type(node: ast.For) -> Optional[str]:
         Optional[str]: A string indicating the type of comprehension ('list' or 'dict'), 
                        or None if the loop is neither.
     """
-    if not isinstance(node, ast.For):
+    if type(node) is not _For:
         return None
 
     # Check if the loop body contains assignments to dictionary keys
-    has_dict_assignment = False
-    has_list_append = False
+    # or appends to the result list
+    state = {'dict': False, 'list': False}
     for subnode in node.body:
-        if isinstance(subnode, ast.Assign) and len(subnode.targets) == 1 and isinstance(subnode.targets[0], ast.Subscript):
-            target = subnode.targets[0]
-            if isinstance(target.value, ast.Name) and target.value.id == 'result' and isinstance(target.slice, ast.Index) and isinstance(target.slice.value, ast.Str):
-                has_dict_assignment = True
-        elif isinstance(subnode, ast.Expr) and isinstance(subnode.value, ast.Call):
-            call = subnode.value
-            if isinstance(call.func, ast.Attribute) and call.func.attr == 'append':
-                if isinstance(call.func.value, ast.Name) and call.func.value.id == 'result':
-                    has_list_append = True
-
-    if has_dict_assignment:
+        _COMPREHENSION_TYPE_HANDLERS.get(type(subnode), _ignore_statement)(subnode, state)
+
+    if state['dict']:
         return 'dict'
-    elif has_list_append:
+    elif state['list']:
         return 'list'
     else:
         return None
 
 
+# Expressions that must be parenthesized in a comprehension's iter or if clause
+_LOOSE_EXPRESSIONS = (ast.IfExp, ast.Lambda)
+
+
+def _unparse_clause(node: ast.expr) -> str:
+    """
+    Unparses the iter or a condition of a comprehension.
+
+    Args:
+        node (ast.expr): The expression AST node.
+
+    Returns:
+        str: The source code of the expression.
+    """
+    source = ast.unparse(node)
+    if type(node) in _LOOSE_EXPRESSIONS:
+        return f"({source})"
+    return source
+
+def _unparse_comprehension(node: ast.expr) -> str:
+    """
+    Unparses a converted for loop.
+
+    A list comprehension with a single generator is formatted directly, so
+    ast.unparse only runs on its element, target, iter and conditions; any
+    other expression is passed to ast.unparse as a whole.
+
+    Args:
+        node (ast.expr): The AST node returned by for_loop_to_list_comprehension.
+
+    Returns:
+        str: The source code of the expression.
+
+    Raises:
+        ValueError: If a list comprehension has no element expression.
+    """
+    if type(node) is not ast.ListComp or len(node.generators) != 1:
+        return ast.unparse(node)
+    if node.elt is None:
+        raise ValueError("list comprehension has no element expression")
+    generator = node.generators[0]
+    target = generator.target
+    if type(target) is ast.Tuple and target.elts:
+        target_source = ', '.join([ast.unparse(element) for element in target.elts])
+        if len(target.elts) == 1:
+            target_source += ','
+    else:
+        target_source = ast.unparse(target)
+    conditions = ''.join([f" if {_unparse_clause(condition)}" for condition in generator.ifs])
+    return f"[{ast.unparse(node.elt)} for {target_source} in {_unparse_clause(generator.iter)}{conditions}]"
+
+
 code = """
 # For loop
 squares = []
@@ -310,8 +814,26 @@ for name, age in zip(names, ages):
 """
 
 
-tree = ast.parse(code)
-for node in ast.walk(tree):
-    if isinstance(node, ast.For):
+class _Converter(ast.NodeVisitor):
+    """
+    Prints the list comprehension for every convertible for loop in a tree.
+
+    Loops whose source lines never mention 'append' are skipped, along with
+    any loops nested in them, before their AST is analyzed.
+    """
+
+    def __init__(self, source: str) -> None:
+        self.lines = split_source_lines(source)
+
+    def visit_For(self, node: ast.For) -> None:
+        if not _mentions_append(node, self.lines):
+            return
         lc = for_loop_to_list_comprehension(node)
-        print(ast.unparse(lc))
+        if lc is not None:
+            print(_unparse_comprehension(lc))
+        self.generic_visit(node)
+
+
+tree = ast.parse(code)
+with cached_pass():
+    _Converter(code).visit(tree)